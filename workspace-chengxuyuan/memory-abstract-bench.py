@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+memory-abstract-bench.py — Benchmarks for memory-abstract-gen.py.
+
+Sub-commands:
+  scan    Check the single-pass Markdown scanner against the reference regex
+          pipeline on a golden corpus and compare their throughput per MB.
+  corpus  Write a reproducible synthetic corpus (mixed CJK/English, tunable
+          heading and code-block density).
+  run     Time memory-abstract-gen.py end to end on a synthetic (or given)
+          corpus: cold, warm no-change, single-file-touched and --force runs,
+          reported as files/sec, MB/sec and peak RSS in JSON.
+
+Zero external dependencies — Python 3.8+ standard library only.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Callable, Dict, List, Optional, Tuple
+
+HERE = Path(__file__).resolve().parent
+
+
+def load_generator() -> ModuleType:
+    """Import memory-abstract-gen.py (its file name is not a module name)."""
+    spec = importlib.util.spec_from_file_location(
+        "memory_abstract_gen", HERE / "memory-abstract-gen.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    # Register before executing so worker processes can unpickle its functions.
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _best_of(repeat: int, fn: Callable[[], None]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+# ---------------------------------------------------------------------------
+# scan: single-pass scanner vs. regex pipeline
+# ---------------------------------------------------------------------------
+
+def load_corpus(paths: List[Path]) -> List[Tuple[str, str]]:
+    """(name, text) for every .md file under *paths*, in a stable order."""
+    docs: List[Tuple[str, str]] = []
+    for root in paths:
+        files = [root] if root.is_file() else sorted(root.rglob("*.md"))
+        for md in files:
+            try:
+                docs.append((str(md), md.read_text(encoding="utf-8")))
+            except (OSError, UnicodeDecodeError):
+                continue
+    return docs
+
+
+def bench_scan(mag: ModuleType, docs: List[Tuple[str, str]], repeat: int = 5) -> dict:
+    """
+    Verify that _scan_markdown() matches the regex pipeline on every document,
+    then time both.  Throughput is reported in MB of UTF-8 input per second.
+    """
+    def legacy(text: str) -> tuple:
+        return mag._extract_headings(text), mag._sentences(mag._strip_markdown(text))
+
+    def scanner(text: str) -> tuple:
+        scan = mag._scan_markdown(text)
+        return scan.headings, scan.sentences
+
+    mismatches = [name for name, text in docs if legacy(text) != scanner(text)]
+    texts = [text for _, text in docs]
+    mb = sum(len(t.encode("utf-8")) for t in texts) / 1e6
+
+    legacy_s = _best_of(repeat, lambda: [legacy(t) for t in texts])
+    scanner_s = _best_of(repeat, lambda: [scanner(t) for t in texts])
+
+    return {
+        "files": len(docs),
+        "mb": round(mb, 4),
+        "mismatches": mismatches,
+        "legacy_s": round(legacy_s, 6),
+        "scanner_s": round(scanner_s, 6),
+        "legacy_ms_per_mb": round(legacy_s * 1000 / mb, 3) if mb else None,
+        "scanner_ms_per_mb": round(scanner_s * 1000 / mb, 3) if mb else None,
+        "speedup": round(legacy_s / scanner_s, 2) if scanner_s else None,
+    }
+
+
+def _cmd_scan(args: argparse.Namespace) -> int:
+    mag = load_generator()
+    docs = load_corpus(args.corpus or [HERE.parent])
+    if not docs:
+        print("Error: golden corpus is empty.", file=sys.stderr)
+        return 1
+
+    report = bench_scan(mag, docs, repeat=args.repeat)
+    if args.json_output:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print(f"Golden corpus: {report['files']} file(s), {report['mb']:.2f} MB")
+        print(f"  regex pipeline : {report['legacy_ms_per_mb']:8.1f} ms/MB")
+        print(f"  scanner        : {report['scanner_ms_per_mb']:8.1f} ms/MB")
+        print(f"  speedup        : {report['speedup']:.2f}×")
+        for name in report["mismatches"]:
+            print(f"  ✗ output differs: {name}", file=sys.stderr)
+    return 1 if report["mismatches"] else 0
+
+
+# ---------------------------------------------------------------------------
+# corpus: synthetic Markdown generator
+# ---------------------------------------------------------------------------
+
+_SYLLABLES = ["ka", "lo", "mi", "ren", "sto", "va", "qu", "del", "ix", "on", "tar", "be", "ul", "sen", "pra"]
+_CJK_COMMON = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+_ENGLISH = (
+    "agent memory index abstract summary heading model config token budget file "
+    "directory search query cache worker process thread pool stream chunk block "
+    "sentence score weight corpus daily weekly note task review deploy server client "
+    "request response latency throughput error retry timeout schedule heartbeat "
+    "channel message user team rule style guide prompt tool skill video subtitle"
+).split()
+
+
+def _synthetic_sentence(rng: random.Random, cjk_ratio: float) -> str:
+    if rng.random() < cjk_ratio:
+        n = rng.randint(8, 40)
+        # Skewed choice so that a few characters are common and most are rare.
+        chars = [_CJK_COMMON[int(len(_CJK_COMMON) * rng.random() ** 2.5)] for _ in range(n)]
+        for _ in range(n // 12):
+            chars[rng.randrange(n)] = "，"
+        return "".join(chars) + rng.choice("。。。！？")
+    words = [rng.choice(_ENGLISH) if rng.random() < 0.6 else _synthetic_word(rng) for _ in range(rng.randint(5, 28))]
+    if rng.random() < 0.15:
+        i = rng.randrange(len(words))
+        words[i] = f"**{words[i]}**"
+    if rng.random() < 0.1:
+        i = rng.randrange(len(words))
+        words[i] = f"[{words[i]}](https://example.com/{words[i]})"
+    if rng.random() < 0.1:
+        i = rng.randrange(len(words))
+        words[i] = f"`{words[i]}`"
+    return " ".join(words).capitalize() + rng.choice("..!?")
+
+
+def _synthetic_word(rng: random.Random) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+
+def synthetic_document(
+    rng: random.Random,
+    size: int,
+    cjk_ratio: float = 0.5,
+    heading_density: float = 0.3,
+    code_density: float = 0.1,
+) -> str:
+    """
+    One Markdown document of about *size* characters.  Each paragraph is
+    preceded by a heading with probability *heading_density* and is a fenced
+    code block with probability *code_density*; prose sentences are CJK with
+    probability *cjk_ratio*, English otherwise.
+    """
+    parts = [f"# {_synthetic_sentence(rng, cjk_ratio).rstrip('.!?。！？')}\n"]
+    length = len(parts[0])
+    while length < size:
+        if rng.random() < heading_density:
+            level = "##" if rng.random() < 0.7 else "###"
+            parts.append(f"{level} {_synthetic_sentence(rng, cjk_ratio).rstrip('.!?。！？')[:60]}\n")
+        if rng.random() < code_density:
+            body = "\n".join(f"    {_synthetic_word(rng)}({_synthetic_word(rng)}, {rng.randint(0, 99)})"
+                             for _ in range(rng.randint(2, 12)))
+            parts.append(f"```python\n{body}\n```\n")
+        elif rng.random() < 0.2:
+            parts.append("".join(f"- {_synthetic_sentence(rng, cjk_ratio)}\n" for _ in range(rng.randint(2, 6))))
+        else:
+            parts.append(" ".join(_synthetic_sentence(rng, cjk_ratio) for _ in range(rng.randint(2, 6))) + "\n")
+        length += len(parts[-1]) + 1
+    return "\n".join(parts)
+
+
+def generate_corpus(
+    out: Path,
+    files: int = 200,
+    seed: int = 0,
+    mean_size: int = 4000,
+    cjk_ratio: float = 0.5,
+    heading_density: float = 0.3,
+    code_density: float = 0.1,
+) -> Tuple[int, int]:
+    """
+    Write *files* synthetic .md files (daily-note style names) into *out*.
+    The same arguments always produce byte-identical files.  Sizes are
+    log-normally distributed around *mean_size* characters.
+    Returns (file count, total bytes).
+    """
+    rng = random.Random(seed)
+    out.mkdir(parents=True, exist_ok=True)
+    total = 0
+    start = time.mktime((2024, 1, 1, 12, 0, 0, 0, 0, -1))
+    for i in range(files):
+        size = max(200, int(rng.lognormvariate(0, 0.8) * mean_size * 0.73))
+        day = time.strftime("%Y-%m-%d", time.localtime(start + i * 86400))
+        text = synthetic_document(rng, size, cjk_ratio, heading_density, code_density)
+        data = text.encode("utf-8")
+        (out / f"{day}.md").write_bytes(data)
+        total += len(data)
+    return files, total
+
+
+def _cmd_corpus(args: argparse.Namespace) -> int:
+    n, total = generate_corpus(
+        args.out, args.files, args.seed, args.size, args.cjk, args.headings, args.code,
+    )
+    print(f"Wrote {n} file(s), {total / 1e6:.2f} MB to {args.out}")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# run: end-to-end timings
+# ---------------------------------------------------------------------------
+
+def _run_generator(directory: Path, extra: List[str]) -> Tuple[float, Optional[float]]:
+    """
+    Run memory-abstract-gen.py once on *directory* in a child process.
+    Returns (wall seconds, peak RSS in MB, or None where unavailable).
+    """
+    cmd = [sys.executable, str(HERE / "memory-abstract-gen.py"), "-d", str(directory)] + extra
+    # stderr goes to a file, not a pipe: nothing reads a pipe while wait4()
+    # blocks, so a child writing more than the pipe buffer would hang.
+    # (RUSAGE_CHILDREN cannot stand in for wait4(): its ru_maxrss is the
+    # peak over every child so far, not this one's.)
+    with tempfile.TemporaryFile() as errors:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=errors)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - t0
+            proc.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+            # ru_maxrss is KiB on Linux, bytes on macOS.
+            rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        else:
+            proc.wait()
+            elapsed = time.perf_counter() - t0
+            rss = None
+        errors.seek(0)
+        stderr = errors.read().decode("utf-8", "replace")
+    if proc.returncode:
+        raise RuntimeError(f"{' '.join(cmd)} failed ({proc.returncode}):\n{stderr}")
+    return elapsed, rss
+
+
+def _clean_outputs(directory: Path) -> None:
+    """Remove everything memory-abstract-gen.py writes, leaving the .md files."""
+    for path in directory.rglob("*"):
+        if path.is_file() and (path.suffix == ".abstract" or path.name.startswith(".abstract-")):
+            path.unlink()
+
+
+def bench_run(
+    corpus: Path,
+    jobs: int = 1,
+    repeat: int = 3,
+    extra: Optional[List[str]] = None,
+) -> dict:
+    """
+    Time the four scenarios on a scratch copy of *corpus* (best of *repeat*):
+    cold (no outputs yet), warm (nothing changed), touch (one file edited)
+    and force (--force).  Rates are over the whole corpus.
+    """
+    md_files = sorted(corpus.rglob("*.md"))
+    if not md_files:
+        raise ValueError(f"no .md files under {corpus}")
+    total_bytes = sum(p.stat().st_size for p in md_files)
+    flags = ["-j", str(jobs)] + (extra or [])
+    scenarios: Dict[str, dict] = {}
+
+    def record(name: str, samples: List[Tuple[float, Optional[float]]]) -> None:
+        seconds = min(t for t, _ in samples)
+        rss = [r for _, r in samples if r is not None]
+        scenarios[name] = {
+            "seconds": round(seconds, 4),
+            "files_per_sec": round(len(md_files) / seconds, 1),
+            "mb_per_sec": round(total_bytes / 1e6 / seconds, 3),
+            "peak_rss_mb": round(max(rss), 1) if rss else None,
+        }
+
+    with tempfile.TemporaryDirectory(prefix="mag-bench-") as tmp:
+        work = Path(tmp) / "corpus"
+        shutil.copytree(corpus, work)
+        _clean_outputs(work)
+        victim = work / md_files[len(md_files) // 2].relative_to(corpus)
+
+        cold, warm, touch, force = [], [], [], []
+        for i in range(repeat):
+            _clean_outputs(work)
+            cold.append(_run_generator(work, flags))
+            warm.append(_run_generator(work, flags))
+            with open(victim, "a", encoding="utf-8") as f:
+                f.write(f"\nBenchmark edit {i}.\n")
+            touch.append(_run_generator(work, flags))
+            force.append(_run_generator(work, flags + ["--force"]))
+
+    record("cold", cold)
+    record("warm", warm)
+    record("touch", touch)
+    record("force", force)
+    return {
+        "files": len(md_files),
+        "mb": round(total_bytes / 1e6, 4),
+        "jobs": jobs,
+        "repeat": repeat,
+        "scenarios": scenarios,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+            capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _cmd_run(args: argparse.Namespace) -> int:
+    extra = (["--recursive"] if args.recursive else []) + ["--store", args.store]
+    params = {
+        "files": args.files, "seed": args.seed, "size": args.size,
+        "cjk": args.cjk, "headings": args.headings, "code": args.code,
+    }
+    with tempfile.TemporaryDirectory(prefix="mag-corpus-") as tmp:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = Path(tmp)
+            generate_corpus(corpus, args.files, args.seed, args.size, args.cjk, args.headings, args.code)
+        report = bench_run(corpus, jobs=args.jobs, repeat=args.repeat, extra=extra)
+
+    report = dict(
+        {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "corpus": str(args.corpus) if args.corpus else {"synthetic": params},
+            "recursive": args.recursive,
+            "store": args.store,
+        },
+        **report,
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    if args.json_output or not args.output:
+        print(text)
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for memory-abstract-gen.py.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=textwrap.dedent("""\
+            Examples:
+              %(prog)s scan                  # golden corpus = sibling workspaces
+              %(prog)s scan -c ~/notes --json
+              %(prog)s corpus /tmp/corpus -n 1000 --cjk 0.8
+              %(prog)s run -n 500 -j 4 -o bench-$(git rev-parse --short HEAD).json
+        """),
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    scan = commands.add_parser("scan", help="Scanner vs. regex pipeline (golden check + ms/MB)")
+    scan.add_argument(
+        "-c", "--corpus",
+        type=Path,
+        action="append",
+        help="File or directory of .md files (repeatable; default: all workspaces)",
+    )
+    scan.add_argument("-n", "--repeat", type=int, default=5, help="Timing repetitions (default: 5)")
+    scan.add_argument("--json", action="store_true", dest="json_output", help="Print the report as JSON")
+    scan.set_defaults(handler=_cmd_scan)
+
+    def corpus_options(p: argparse.ArgumentParser) -> None:
+        p.add_argument("-n", "--files", type=int, default=200, help="Number of files (default: 200)")
+        p.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+        p.add_argument("--size", type=int, default=4000, help="Mean file size in characters (default: 4000)")
+        p.add_argument("--cjk", type=float, default=0.5, help="Share of CJK sentences (default: 0.5)")
+        p.add_argument("--headings", type=float, default=0.3, help="Heading probability per paragraph (default: 0.3)")
+        p.add_argument("--code", type=float, default=0.1, help="Code-block probability per paragraph (default: 0.1)")
+
+    corpus = commands.add_parser("corpus", help="Write a reproducible synthetic corpus")
+    corpus.add_argument("out", type=Path, help="Output directory")
+    corpus_options(corpus)
+    corpus.set_defaults(handler=_cmd_corpus)
+
+    bench = commands.add_parser("run", help="Cold / warm / touch / force timings as JSON")
+    bench.add_argument("-c", "--corpus", type=Path, help="Benchmark this directory instead of a synthetic corpus")
+    corpus_options(bench)
+    bench.add_argument("-j", "--jobs", type=int, default=1, help="--jobs passed to the generator (default: 1)")
+    bench.add_argument("-r", "--recursive", action="store_true", help="Run the generator with --recursive")
+    bench.add_argument("--store", choices=("json", "sqlite"), default="json", help="--store passed to the generator")
+    bench.add_argument("--repeat", type=int, default=3, help="Repetitions; the best time is kept (default: 3)")
+    bench.add_argument("-o", "--output", type=Path, help="Also write the JSON report to this file")
+    bench.add_argument("--json", action="store_true", dest="json_output", help="Print JSON even with --output")
+    bench.set_defaults(handler=_cmd_run)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,45 +4,612 @@ MediaFlow Skill Implementation
 This skill provides tools for video downloading, transcription, and translation
 using the MediaFlow backend API.
 """
+import asyncio
+import hashlib
+import json
 import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
 import httpx
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Iterable, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 
 MEDIAFLOW_HOST = os.environ.get("MEDIAFLOW_HOST", "127.0.0.1")
 MEDIAFLOW_PORT = os.environ.get("MEDIAFLOW_PORT", "8002")
 BASE_URL = f"http://{MEDIAFLOW_HOST}:{MEDIAFLOW_PORT}"
 
+# Connection pool defaults; one pool is shared by every call on a client.
+MEDIAFLOW_TIMEOUT = float(os.environ.get("MEDIAFLOW_TIMEOUT", "120"))
+MEDIAFLOW_MAX_CONNECTIONS = int(os.environ.get("MEDIAFLOW_MAX_CONNECTIONS", "20"))
+MEDIAFLOW_MAX_KEEPALIVE = int(os.environ.get("MEDIAFLOW_MAX_KEEPALIVE", "20"))
+MEDIAFLOW_KEEPALIVE_EXPIRY = float(os.environ.get("MEDIAFLOW_KEEPALIVE_EXPIRY", "30"))
+
+# Task polling: the delay starts small, grows while progress stalls, and
+# follows the estimated time to completion while progress is moving.
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+POLL_INITIAL_DELAY = 0.5
+POLL_MAX_DELAY = 10.0
+POLL_BACKOFF = 2.0
+
+
+class _PollSchedule:
+    """Adaptive poll delay for one task, driven by its reported progress."""
+    
+    def __init__(self, initial_delay: float, max_delay: float):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.delay = initial_delay
+        self._seen: Optional[tuple] = None  # (time, progress) of last advance
+    
+    def update(self, progress: Optional[float], now: float) -> float:
+        """Record a status observation and return the delay until the next."""
+        if progress is None:
+            self.delay *= POLL_BACKOFF
+        elif self._seen is None:
+            self._seen = (now, progress)
+        elif progress > self._seen[1] and now > self._seen[0]:
+            rate = (progress - self._seen[1]) / (now - self._seen[0])
+            # Check back halfway to the estimated finish, so the delay
+            # shrinks as the task nears completion.
+            self.delay = (100.0 - progress) / rate / 2
+            self._seen = (now, progress)
+        else:
+            self.delay *= POLL_BACKOFF
+        self.delay = min(max(self.delay, self.initial_delay), self.max_delay)
+        return self.delay
+
+
+# Batch calls: at most BATCH_CONCURRENCY requests in flight, started at no
+# more than BATCH_RATE per second (bursts up to the concurrency limit).
+BATCH_CONCURRENCY = 8
+BATCH_RATE = 10.0
+
+
+class _TokenBucket:
+    """Token-bucket rate limiter: `rate` acquisitions per second."""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._stamp: Optional[float] = None
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if self._stamp is not None:
+                    self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Local caches (analyze metadata, translation memory), shared across sessions
+# and workspaces on this host. MEDIAFLOW_ANALYZE_CACHE_TTL=0 and
+# MEDIAFLOW_TRANSLATION_MEMORY_MAX_ENTRIES=0 turn them off for the shared client.
+CACHE_DIR = os.environ.get(
+    "MEDIAFLOW_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "mediaflow")
+)
+ANALYZE_CACHE_TTL = float(os.environ.get("MEDIAFLOW_ANALYZE_CACHE_TTL", "86400"))
+ANALYZE_CACHE_MAX_ENTRIES = int(os.environ.get("MEDIAFLOW_ANALYZE_CACHE_MAX_ENTRIES", "2000"))
+
+# Query parameters that only track where a link was shared from: utm_* and
+# these click IDs on every host, plus per-site share trackers (matched on
+# the host and its subdomains, compared lowercased). Anything else may
+# select content, so it is kept.
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid",
+    "mc_cid", "mc_eid", "_ga",
+}
+SITE_TRACKING_PARAMS = {
+    "youtube.com": {"si", "feature", "pp", "ab_channel"},
+    "youtu.be": {"si", "feature"},
+    "bilibili.com": {
+        "spm_id_from", "vd_source", "from_spmid", "share_source", "share_medium",
+        "share_plat", "share_session_id", "share_tag", "share_from", "bbid",
+        "ts", "unique_k", "buvid", "from",
+    },
+    "b23.tv": {"share_source", "share_medium", "share_plat", "share_tag", "bbid", "ts"},
+    "x.com": {"s", "t", "ref_src", "ref_url"},
+    "twitter.com": {"s", "t", "ref_src", "ref_url"},
+    "instagram.com": {"igshid", "igsh"},
+    "xiaohongshu.com": {
+        "xsec_source", "xsec_token", "source", "share_from_user_hidden",
+        "app_platform", "app_version", "share_id", "author_share", "apptime",
+    },
+    "douyin.com": {
+        "previous_page", "enter_from", "from_ssr", "is_from_webapp",
+        "sender_device", "share_sign", "share_version", "u_code", "timestamp",
+    },
+    "tiktok.com": {"is_from_webapp", "sender_device", "_r", "_t", "share_app_id"},
+    "kuaishou.com": {
+        "shareid", "sharetoken", "sharemethod", "shareresourcetype",
+        "shareobjectid", "shareurlopened", "kpn", "subbiz", "fid", "cc", "timestamp",
+    },
+}
+YOUTUBE_HOSTS = {"youtube.com", "m.youtube.com", "music.youtube.com", "youtu.be"}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a media URL, used as the analyze cache key.
+    
+    Lowercases the scheme and host, drops "www.", the fragment and tracking
+    parameters (utm_* and click IDs everywhere, SITE_TRACKING_PARAMS for the
+    host), sorts the remaining query, and rewrites youtu.be / mobile / shorts
+    YouTube links to youtube.com/watch. A URL without a scheme is taken
+    to start with the host, and one with an invalid port keeps its host
+    and port as given.
+    """
+    url = url.strip()
+    parts = urlsplit(url)
+    if not parts.netloc:
+        # "youtu.be/abc": without "//" urlsplit reads the host as the path.
+        parts = urlsplit("//" + url)
+    scheme = (parts.scheme or "https").lower()
+    if scheme == "http":
+        scheme = "https"
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port, host = None, parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path
+    trackers = set(TRACKING_PARAMS)
+    for site, params in SITE_TRACKING_PARAMS.items():
+        if host == site or host.endswith("." + site):
+            trackers |= params
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in trackers
+    ]
+    if host in YOUTUBE_HOSTS:
+        video_id = None
+        if host == "youtu.be":
+            video_id = path.strip("/").split("/")[0]
+        elif path.startswith(("/shorts/", "/live/", "/embed/")):
+            video_id = path.split("/")[2]
+        if video_id:
+            query.append(("v", video_id))
+        host = "youtube.com"
+        if video_id:
+            path = "/watch"
+        # A start time does not change the video's metadata.
+        query = [(key, value) for key, value in query if key not in ("t", "start")]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    if path != "/":
+        path = path.rstrip("/")
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+class AnalyzeCache:
+    """
+    On-disk cache of analyze_url() results keyed by normalize_url().
+    
+    One JSON file per URL, so concurrent processes can share the directory.
+    Entries expire after `ttl` seconds. Once `max_entries` is exceeded, the
+    least recently used entries (by file mtime, refreshed on every hit) are
+    evicted in one batch down to EVICT_TO of the limit, so the directory is
+    scanned once per batch rather than on every put. The client calls put()
+    from a worker thread.
+    """
+    
+    EVICT_TO = 0.9
+    
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        ttl: float = ANALYZE_CACHE_TTL,
+        max_entries: int = ANALYZE_CACHE_MAX_ENTRIES
+    ):
+        self.directory = os.path.join(directory, "analyze")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._count: Optional[int] = None  # entries on disk, as far as we know
+        self._lock = threading.Lock()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".json")
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for a normalized URL, or None."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != key or time.time() - entry.get("time", 0) > self.ttl:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get("data")
+    
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        """Store a result for a normalized URL, evicting old entries if full."""
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"url": key, "time": time.time(), "data": data}, f, ensure_ascii=False)
+            existed = os.path.exists(path)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            if self._count is None:
+                self._count = len(self._entries())
+            elif not existed:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+    
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        with self._lock:
+            for path in self._entries():
+                self._remove(path)
+            self._count = 0
+    
+    def _entries(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.endswith(".json")]
+    
+    def _evict(self) -> None:
+        # Other processes may share the directory, so recount from disk.
+        stamped = []
+        for path in self._entries():
+            try:
+                stamped.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        keep = int(self.max_entries * self.EVICT_TO)
+        stamped.sort()
+        for _, path in stamped[:max(0, len(stamped) - keep)]:
+            self._remove(path)
+        self._count = min(len(stamped), keep)
+    
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Chunked translation: long subtitle lists are split into chunks of roughly
+# TRANSLATE_CHUNK_TOKENS, each sent with TRANSLATE_CHUNK_OVERLAP neighbouring
+# segments on both sides as context, and translated as parallel tasks.
+TRANSLATE_CHUNK_TOKENS = 1500
+TRANSLATE_CHUNK_OVERLAP = 2
+TRANSLATE_CONCURRENCY = 4
+SEGMENT_TOKEN_OVERHEAD = 8  # timestamps and JSON framing per segment
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough LLM token count: one per CJK character, one per ~4 others."""
+    wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return wide + (len(text) - wide + 3) // 4 + SEGMENT_TOKEN_OVERHEAD
+
+
+def chunk_segments(
+    segments: List[Dict[str, Any]],
+    max_tokens: int = TRANSLATE_CHUNK_TOKENS,
+    overlap: int = TRANSLATE_CHUNK_OVERLAP,
+    wanted: Optional[Set[int]] = None
+) -> List[tuple]:
+    """
+    Split segments (in timestamp order) into translation chunks.
+    
+    With `wanted`, only those indices need translating: chunks are built
+    around them, and lines in between are sent along as context, counting
+    against the budget only when another wanted line follows them.
+    
+    Returns:
+        List of (lo, start, end, hi) index tuples: segments[start:end] is the
+        chunk's own range, segments[lo:hi] is what gets sent, including up
+        to `overlap` real neighbouring segments on each side
+    """
+    chunks, first, last, budget, gap = [], None, None, 0, 0
+    for index, segment in enumerate(segments):
+        cost = _estimate_tokens(segment.get("text", ""))
+        if wanted is not None and index not in wanted:
+            if first is not None:
+                gap += cost
+            continue
+        if first is not None and budget + gap + cost > max_tokens:
+            chunks.append((first, last + 1))
+            first, budget = None, 0
+        if first is None:
+            first = index
+        else:
+            budget += gap
+        last, gap = index, 0
+        budget += cost
+    if first is not None:
+        chunks.append((first, last + 1))
+    return [
+        (max(0, start - overlap), start, end, min(len(segments), end + overlap))
+        for start, end in chunks
+    ]
+
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.environ.get("MEDIAFLOW_TRANSLATION_MEMORY_MAX_ENTRIES", "200000"))
+
+
+def normalize_subtitle_text(text: str) -> str:
+    """Translation memory key text: NFKC-normalized, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class TranslationMemory:
+    """
+    Local store of subtitle translations, keyed by (normalized text, source
+    language, target language, mode).
+    
+    Backed by SQLite so several processes can share it. Past `max_entries`
+    the least recently used translations are dropped. Hit counters cover the
+    lifetime of this object and are returned by stats(). Methods may be
+    called from worker threads (the client uses asyncio.to_thread).
+    """
+    
+    def __init__(
+        self,
+        path: str = os.path.join(CACHE_DIR, "translations.sqlite"),
+        max_entries: int = TRANSLATION_MEMORY_MAX_ENTRIES
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.saved_calls = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS memory ("
+                " source TEXT NOT NULL, target TEXT NOT NULL, mode TEXT NOT NULL,"
+                " text TEXT NOT NULL, translation TEXT NOT NULL, used REAL NOT NULL,"
+                " PRIMARY KEY (source, target, mode, text))"
+            )
+            self._db.commit()
+        return self._db
+    
+    def lookup(self, texts: Iterable[str], source: str, target: str, mode: str) -> Dict[str, str]:
+        """Known translations for normalized texts, as {text: translation}."""
+        texts = list(dict.fromkeys(texts))
+        found = {}
+        with self._lock:
+            db = self._connect()
+            for offset in range(0, len(texts), 500):
+                batch = texts[offset:offset + 500]
+                rows = db.execute(
+                    "SELECT text, translation FROM memory"
+                    " WHERE source = ? AND target = ? AND mode = ?"
+                    f" AND text IN ({','.join('?' * len(batch))})",
+                    [source, target, mode] + batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                db.executemany(
+                    "UPDATE memory SET used = ?"
+                    " WHERE source = ? AND target = ? AND mode = ? AND text = ?",
+                    [(now, source, target, mode, text) for text in found]
+                )
+                db.commit()
+        return found
+    
+    def store(self, translations: Dict[str, str], source: str, target: str, mode: str) -> None:
+        """Remember {normalized text: translation} pairs."""
+        if not translations:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.executemany(
+                "INSERT OR REPLACE INTO memory VALUES (?, ?, ?, ?, ?, ?)",
+                [(source, target, mode, text, translation, now)
+                 for text, translation in translations.items()]
+            )
+            (count,) = db.execute("SELECT COUNT(*) FROM memory").fetchone()
+            if count > self.max_entries:
+                db.execute(
+                    "DELETE FROM memory WHERE rowid IN"
+                    " (SELECT rowid FROM memory ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            db.commit()
+    
+    def record(self, hits: int, misses: int, saved_calls: int) -> None:
+        """Add one batch's outcome to the running counters."""
+        self.hits += hits
+        self.misses += misses
+        self.saved_calls += saved_calls
+    
+    def stats(self) -> Dict[str, Any]:
+        """Running hit/miss counters, hit rate, saved calls and entry count."""
+        lookups = self.hits + self.misses
+        with self._lock:
+            (entries,) = self._connect().execute("SELECT COUNT(*) FROM memory").fetchone()
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "saved_calls": self.saved_calls,
+            "entries": entries,
+        }
+    
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
 
 class MediaFlowClient:
-    """Client for MediaFlow API."""
+    """
+    Client for MediaFlow API.
     
-    def __init__(self):
-        self.base_url = BASE_URL
+    The client owns one long-lived httpx.AsyncClient, so status polls and
+    back-to-back calls reuse keep-alive connections instead of reconnecting.
+    The pool is opened lazily on first use; close it with close() or use the
+    client as an async context manager:
+    
+        async with MediaFlowClient() as client:
+            await client.health_check()
+    
+    A pool belongs to the event loop that opened it. One left open is closed
+    when that loop shuts down its async generators (asyncio.run does), and
+    close() from another loop schedules the close on the pool's own loop.
+    """
+    
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        timeout: float = MEDIAFLOW_TIMEOUT,
+        max_connections: int = MEDIAFLOW_MAX_CONNECTIONS,
+        max_keepalive_connections: int = MEDIAFLOW_MAX_KEEPALIVE,
+        keepalive_expiry: float = MEDIAFLOW_KEEPALIVE_EXPIRY,
+        analyze_cache: Optional[AnalyzeCache] = None,
+        translation_memory: Optional[TranslationMemory] = None
+    ):
+        self.base_url = base_url or BASE_URL
+        self.analyze_cache = analyze_cache
+        self.translation_memory = translation_memory
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._http: Optional[httpx.AsyncClient] = None
+        self._guard: Optional[AsyncIterator[None]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._analyzing: Dict[str, asyncio.Future] = {}
+    
+    async def open(self) -> httpx.AsyncClient:
+        """Open the connection pool if needed and return it."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Pooled connections belong to the event loop that opened them.
+            # When the caller runs each tool call in a fresh loop (e.g. one
+            # asyncio.run per call) the old pool is unusable, so start over.
+            self._release()
+            self._analyzing = {}
+            self._loop = loop
+        # No await between the check and the assignment, so concurrent
+        # callers on this loop always end up sharing a single pool.
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits
+            )
+            self._guard = self._closing(self._http)
+            await self._guard.__anext__()
+        return self._http
+    
+    async def close(self) -> None:
+        """Close the connection pool; the next call opens a new one."""
+        if self._loop is not asyncio.get_running_loop():
+            self._release()
+            return
+        guard, self._http, self._guard = self._guard, None, None
+        if guard is not None:
+            await guard.aclose()
+    
+    def _release(self) -> None:
+        """Drop the pool, closing it on its own loop if that still runs."""
+        guard, self._http, self._guard = self._guard, None, None
+        if guard is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._loop.create_task, guard.aclose())
+    
+    @staticmethod
+    async def _closing(http: httpx.AsyncClient) -> AsyncIterator[None]:
+        # Started on the pool's loop, so the loop tracks it and closes it
+        # (and with it the pool) in shutdown_asyncgens() before it closes.
+        try:
+            yield
+        finally:
+            await http.aclose()
+    
+    async def __aenter__(self) -> "MediaFlowClient":
+        await self.open()
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
     
     async def _request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         """Make HTTP request to MediaFlow API."""
         url = f"{self.base_url}{endpoint}"
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.request(method, url, **kwargs)
-            response.raise_for_status()
-            return response.json()
+        http = await self.open()
+        response = await http.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response.json()
     
-    async def analyze_url(self, url: str) -> Dict[str, Any]:
+    async def analyze_url(self, url: str, refresh: bool = False) -> Dict[str, Any]:
         """
         Analyze a URL to extract metadata.
         
+        Results are served from the analyze cache when one is configured, and
+        concurrent calls for the same (normalized) URL share one request.
+        
         Args:
             url: URL to analyze
+            refresh: Skip the cache lookup and fetch fresh metadata
             
         Returns:
             Dict with url, title, thumbnail, duration, platform, is_video
         """
-        return await self._request(
+        key = normalize_url(url)
+        if self.analyze_cache is not None and not refresh:
+            cached = await asyncio.to_thread(self.analyze_cache.get, key)
+            if cached is not None:
+                return cached
+        await self.open()
+        future = self._analyzing.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._analyze(key, url))
+            self._analyzing[key] = future
+            future.add_done_callback(lambda _: self._analyzing.pop(key, None))
+        # Shielded so one caller giving up doesn't cancel the others' request.
+        return await asyncio.shield(future)
+    
+    async def _analyze(self, key: str, url: str) -> Dict[str, Any]:
+        result = await self._request(
             "POST",
             "/api/v1/analyze/",
             json={"url": url}
         )
+        if self.analyze_cache is not None:
+            await asyncio.to_thread(self.analyze_cache.put, key, result)
+        return result
     
     async def download_media(
         self,
@@ -147,6 +714,184 @@ class MediaFlowClient:
             }
         )
     
+    async def translate_subtitles_chunked(
+        self,
+        segments: List[Dict[str, Any]],
+        target_language: str,
+        provider: str = "openai",
+        mode: str = "standard",
+        chunk_tokens: int = TRANSLATE_CHUNK_TOKENS,
+        overlap: int = TRANSLATE_CHUNK_OVERLAP,
+        concurrency: int = TRANSLATE_CONCURRENCY,
+        timeout: Optional[float] = None,
+        source_language: Optional[str] = None,
+        use_memory: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Translate a long subtitle list as parallel, context-overlapping chunks.
+        
+        Segments are split by approximate token budget; each chunk is sent with
+        `overlap` neighbouring segments on both sides for continuity, and only
+        its own segments are kept from the reply. Up to `concurrency` chunks
+        are translated at once and the result is reassembled in timestamp
+        order, so latency follows the slowest chunk rather than the total.
+        
+        With a translation memory configured, lines translated before are
+        filled in locally and a line repeated in the batch is translated
+        once. Chunks are built around the remaining lines only; their real
+        neighbours, known lines included, still go along as context.
+        
+        Args:
+            segments: List of SubtitleSegment objects with start, end, text
+            target_language: Target language (e.g., zh, en, ja, ko)
+            provider: LLM provider (openai)
+            mode: Translation mode (standard, reflect)
+            chunk_tokens: Approximate token budget per chunk
+            overlap: Context segments sent on each side of a chunk
+            concurrency: Chunks translated at the same time
+            timeout: Seconds to wait before raising asyncio.TimeoutError
+            source_language: Source language, part of the memory key
+                (default: auto)
+            use_memory: Consult and update the translation memory
+            
+        Returns:
+            Dict with status (completed, or partial if some chunks failed),
+            segments (translated, in timestamp order; failed chunks keep the
+            original text), chunks, task_ids and failed_chunks (index, start,
+            end, error); with the memory, also memory (segments, hits,
+            duplicates, sent, hit_rate, saved_segments, saved_calls)
+        """
+        ordered = sorted(segments, key=lambda segment: segment.get("start", 0))
+        memory = self.translation_memory if use_memory else None
+        if memory is None:
+            translations, task_ids, failed = await self._translate_chunks(
+                ordered, None, target_language, provider, mode,
+                chunk_tokens, overlap, concurrency, timeout
+            )
+            return {
+                "status": "partial" if failed else "completed",
+                "segments": [translations.get(index, segment) for index, segment in enumerate(ordered)],
+                "chunks": len(task_ids),
+                "task_ids": task_ids,
+                "failed_chunks": failed,
+            }
+        source = source_language or "auto"
+        keys = [normalize_subtitle_text(segment.get("text", "")) for segment in ordered]
+        known = await asyncio.to_thread(memory.lookup, keys, source, target_language, mode)
+        hits = sum(1 for key in keys if key in known)
+        # Only the first occurrence of each unknown line is translated; hits
+        # and repeats stay in the timeline as context for their neighbours.
+        first: Dict[str, int] = {}
+        for index, key in enumerate(keys):
+            if key not in known:
+                first.setdefault(key, index)
+        translations, task_ids, failed = await self._translate_chunks(
+            ordered, set(first.values()), target_language, provider, mode,
+            chunk_tokens, overlap, concurrency, timeout
+        )
+        # Failed chunks have no entry here, so nothing wrong is learned.
+        learned = {
+            key: translations[index].get("text", "")
+            for key, index in first.items() if index in translations
+        }
+        await asyncio.to_thread(memory.store, learned, source, target_language, mode)
+        known.update(learned)
+        
+        saved_calls = len(chunk_segments(ordered, chunk_tokens, overlap)) - len(task_ids)
+        memory.record(hits, len(ordered) - hits, saved_calls)
+        return {
+            "status": "partial" if failed else "completed",
+            "segments": [
+                dict(segment, text=known.get(key, segment.get("text", "")))
+                for key, segment in zip(keys, ordered)
+            ],
+            "chunks": len(task_ids),
+            "task_ids": task_ids,
+            "failed_chunks": failed,
+            "memory": {
+                "segments": len(ordered),
+                "hits": hits,
+                "duplicates": len(ordered) - hits - len(first),
+                "sent": len(first),
+                "hit_rate": round(hits / len(ordered), 3) if ordered else 0.0,
+                "saved_segments": len(ordered) - len(first),
+                "saved_calls": saved_calls,
+            },
+        }
+    
+    async def _translate_chunks(
+        self,
+        ordered: List[Dict[str, Any]],
+        wanted: Optional[Set[int]],
+        target_language: str,
+        provider: str,
+        mode: str,
+        chunk_tokens: int,
+        overlap: int,
+        concurrency: int,
+        timeout: Optional[float]
+    ) -> tuple:
+        """
+        Translate the `wanted` indices (None: all) of timestamp-ordered segments.
+        
+        Every chunk is sent with its real neighbouring lines as context; the
+        backend translates those too, but only wanted lines are taken from the
+        reply.
+        
+        Returns:
+            (translations, task_ids, failed_chunks): translations maps an index
+            in `ordered` to its translated segment and is missing the lines of
+            failed chunks
+        """
+        chunks = chunk_segments(ordered, chunk_tokens, overlap, wanted)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        waiter = _TaskWaiter(self)
+        task_ids: List[Optional[str]] = [None] * len(chunks)
+        
+        async def translate(index: int, lo: int, start: int, end: int, hi: int) -> Dict[int, Dict[str, Any]]:
+            async with semaphore:
+                submitted = await self.translate_subtitles(
+                    ordered[lo:hi], target_language, provider, mode
+                )
+                task_ids[index] = submitted["task_id"]
+                result = await waiter.result(submitted["task_id"])
+            own = [i for i in range(start, end) if wanted is None or i in wanted]
+            translated = result.get("segments") or []
+            if len(translated) == hi - lo:
+                return {i: translated[i - lo] for i in own}
+            # The reply doesn't line up one-to-one; match by start time.
+            by_start = {segment.get("start"): segment for segment in translated}
+            return {
+                i: by_start[ordered[i].get("start")]
+                for i in own if ordered[i].get("start") in by_start
+            }
+        
+        jobs = asyncio.gather(
+            *(translate(index, *chunk) for index, chunk in enumerate(chunks)),
+            return_exceptions=True
+        )
+        try:
+            results = await (jobs if timeout is None else asyncio.wait_for(jobs, timeout))
+        finally:
+            # On timeout or cancellation, don't leave the poller sweeping
+            # for chunks nobody is waiting on any more.
+            waiter.close()
+        translations: Dict[int, Dict[str, Any]] = {}
+        failed = []
+        for index, ((lo, start, end, hi), result) in enumerate(zip(chunks, results)):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                failed.append({
+                    "index": index,
+                    "start": ordered[start].get("start"),
+                    "end": ordered[end - 1].get("end"),
+                    "error": str(result) or type(result).__name__,
+                })
+            else:
+                translations.update(result)
+        return translations, task_ids, failed
+    
     async def get_task_status(self, task_id: str) -> Dict[str, Any]:
         """
         Get status of a background task.
@@ -180,6 +925,535 @@ class MediaFlowClient:
             "GET",
             "/health"
         )
+    
+    async def wait_for_task(
+        self,
+        task_id: str,
+        timeout: Optional[float] = None,
+        initial_delay: float = POLL_INITIAL_DELAY,
+        max_delay: float = POLL_MAX_DELAY
+    ) -> Dict[str, Any]:
+        """
+        Poll a task until it completes, fails or is cancelled.
+        
+        Args:
+            task_id: Task ID to wait for
+            timeout: Seconds to wait before raising asyncio.TimeoutError
+            initial_delay: First (and shortest) delay between polls
+            max_delay: Longest delay between polls
+            
+        Returns:
+            Final task object (id, status, progress, result, error)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        schedule = _PollSchedule(initial_delay, max_delay)
+        while True:
+            task = await self.get_task_status(task_id)
+            if task.get("status") in TERMINAL_STATUSES:
+                return task
+            delay = schedule.update(task.get("progress"), loop.time())
+            if deadline is not None:
+                if loop.time() >= deadline:
+                    raise asyncio.TimeoutError(f"task {task_id} still {task.get('status')}")
+                delay = min(delay, deadline - loop.time())
+            await asyncio.sleep(delay)
+    
+    async def _sweep(self, task_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Current state of several tasks: one list_tasks() call, plus
+        get_task_status() for any task the listing doesn't include."""
+        listed = {task.get("id"): task for task in await self.list_tasks()}
+        missing = [task_id for task_id in task_ids if task_id not in listed]
+        if missing:
+            fetched = await asyncio.gather(
+                *(self.get_task_status(task_id) for task_id in missing)
+            )
+            listed.update(zip(missing, fetched))
+        return listed
+    
+    async def iter_completed(
+        self,
+        task_ids: Iterable[str],
+        timeout: Optional[float] = None,
+        initial_delay: float = POLL_INITIAL_DELAY,
+        max_delay: float = POLL_MAX_DELAY
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield tasks as they finish, in completion order.
+        
+        Each poll is one list_tasks() sweep covering every pending task;
+        only tasks missing from the listing are fetched one by one. The next
+        sweep is due when the soonest-finishing task is expected to need it.
+        
+        Args:
+            task_ids: Task IDs to wait for
+            timeout: Seconds to wait before raising asyncio.TimeoutError
+            initial_delay: First (and shortest) delay between sweeps
+            max_delay: Longest delay between sweeps
+            
+        Yields:
+            Final task objects (id, status, progress, result, error)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        pending = {
+            task_id: _PollSchedule(initial_delay, max_delay)
+            for task_id in dict.fromkeys(task_ids)
+        }
+        while pending:
+            listed = await self._sweep(pending)
+            now = loop.time()
+            delay = max_delay
+            for task_id in list(pending):
+                task = listed[task_id]
+                if task.get("status") in TERMINAL_STATUSES:
+                    del pending[task_id]
+                    yield task
+                else:
+                    delay = min(delay, pending[task_id].update(task.get("progress"), now))
+            if not pending:
+                return
+            if deadline is not None:
+                if loop.time() >= deadline:
+                    raise asyncio.TimeoutError(f"{len(pending)} task(s) still running")
+                delay = min(delay, deadline - loop.time())
+            await asyncio.sleep(delay)
+    
+    async def wait_for_many(
+        self,
+        task_ids: Iterable[str],
+        timeout: Optional[float] = None,
+        initial_delay: float = POLL_INITIAL_DELAY,
+        max_delay: float = POLL_MAX_DELAY
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Wait for several tasks, polling all of them with one sweep per round.
+        
+        Args:
+            task_ids: Task IDs to wait for
+            timeout: Seconds to wait before raising asyncio.TimeoutError
+            initial_delay: First (and shortest) delay between sweeps
+            max_delay: Longest delay between sweeps
+            
+        Returns:
+            Dict mapping each task ID (in input order) to its final task object
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        done = {}
+        async for task in self.iter_completed(task_ids, timeout, initial_delay, max_delay):
+            done[task.get("id")] = task
+        return {task_id: done[task_id] for task_id in task_ids}
+    
+    async def _map_urls(
+        self,
+        call: Callable[[str], Awaitable[Dict[str, Any]]],
+        urls: Iterable[str],
+        concurrency: int,
+        rate: Optional[float]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run `call` for every URL concurrently, yielding in completion order."""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        bucket = _TokenBucket(rate, concurrency) if rate else None
+        
+        async def one(index: int, url: str) -> Dict[str, Any]:
+            async with semaphore:
+                if bucket is not None:
+                    await bucket.acquire()
+                try:
+                    result = await call(url)
+                except Exception as exc:
+                    # Any per-URL failure is reported in its item; only
+                    # cancellation (not an Exception) stops the batch.
+                    return {"index": index, "url": url, "result": None,
+                            "error": str(exc) or type(exc).__name__}
+                return {"index": index, "url": url, "result": result, "error": None}
+        
+        tasks = [asyncio.ensure_future(one(index, url)) for index, url in enumerate(urls)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            # The caller stopped early: don't leave requests running.
+            for task in tasks:
+                task.cancel()
+    
+    def analyze_many(
+        self,
+        urls: Iterable[str],
+        concurrency: int = BATCH_CONCURRENCY,
+        rate: Optional[float] = BATCH_RATE
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Analyze many URLs concurrently.
+        
+        Args:
+            urls: URLs to analyze
+            concurrency: Maximum requests in flight
+            rate: Maximum requests started per second (None: unlimited)
+            
+        Yields:
+            Dict with index, url, result (analyze_url output) and error,
+            in completion order; a failed URL has result None and an error
+        """
+        return self._map_urls(self.analyze_url, urls, concurrency, rate)
+    
+    def download_many(
+        self,
+        urls: Iterable[str],
+        format: str = "best",
+        output_path: Optional[str] = None,
+        concurrency: int = BATCH_CONCURRENCY,
+        rate: Optional[float] = BATCH_RATE
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Submit downloads for many URLs concurrently.
+        
+        Args:
+            urls: Media URLs to download
+            format: Quality format (best, 4k, 2k, 1080p, 720p, 480p, audio)
+            output_path: Output directory path
+            concurrency: Maximum requests in flight
+            rate: Maximum requests started per second (None: unlimited)
+            
+        Yields:
+            Dict with index, url, result (download_media output: task_id,
+            status) and error, in completion order
+        """
+        async def call(url: str) -> Dict[str, Any]:
+            return await self.download_media(url, format, output_path)
+        return self._map_urls(call, urls, concurrency, rate)
+
+
+class _TaskWaiter:
+    """
+    Awaits backend tasks submitted at different times through one poller.
+    
+    Unlike iter_completed(), tasks can be added while others are pending;
+    every round is still a single sweep over all of them.
+    """
+    
+    def __init__(
+        self,
+        client: MediaFlowClient,
+        initial_delay: float = POLL_INITIAL_DELAY,
+        max_delay: float = POLL_MAX_DELAY
+    ):
+        self.client = client
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._waiting: Dict[str, tuple] = {}
+        self._poller: Optional[asyncio.Future] = None
+        self._wake: Optional[asyncio.Event] = None
+    
+    async def wait(self, task_id: str) -> Dict[str, Any]:
+        """Wait for a task to reach a terminal status and return it."""
+        entry = self._waiting.get(task_id)
+        if entry is None:
+            future = asyncio.get_running_loop().create_future()
+            entry = (future, _PollSchedule(self.initial_delay, self.max_delay))
+            self._waiting[task_id] = entry
+        if self._poller is None or self._poller.done():
+            self._wake = asyncio.Event()
+            self._poller = asyncio.ensure_future(self._poll())
+        else:
+            self._wake.set()
+        try:
+            return await entry[0]
+        finally:
+            # A caller that gave up shouldn't keep its task in the sweeps.
+            if entry[0].cancelled() and self._waiting.get(task_id) is entry:
+                del self._waiting[task_id]
+    
+    async def result(self, task_id: str) -> Dict[str, Any]:
+        """Wait for a task and return its result, raising RuntimeError if it
+        failed or was cancelled."""
+        task = await self.wait(task_id)
+        if task.get("status") != "completed":
+            raise RuntimeError(f"task {task_id} {task.get('status')}: {task.get('error')}")
+        return task.get("result") or {}
+    
+    def close(self) -> None:
+        """Stop polling and cancel any outstanding waits."""
+        if self._poller is not None and not self._poller.done():
+            self._poller.cancel()
+        self._fail(None)
+    
+    def _fail(self, exc: Optional[BaseException]) -> None:
+        """Resolve every outstanding wait with `exc` (None: cancel them)."""
+        waiting, self._waiting = self._waiting, {}
+        for future, _ in waiting.values():
+            if future.done():
+                continue
+            if exc is None:
+                future.cancel()
+            else:
+                future.set_exception(exc)
+    
+    async def _poll(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self._waiting:
+                self._wake.clear()
+                delay = self.initial_delay
+                if not any(schedule._seen is None for _, schedule in self._waiting.values()):
+                    delay = min(schedule.delay for _, schedule in self._waiting.values())
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    # A task was just submitted; give it a moment before sweeping.
+                    await asyncio.sleep(self.initial_delay)
+                # Tasks registered while the sweep is in flight aren't in
+                # `listed`; they are picked up by the next round.
+                task_ids = list(self._waiting)
+                listed = await self.client._sweep(task_ids)
+                now = loop.time()
+                for task_id in task_ids:
+                    entry = self._waiting.get(task_id)
+                    task = listed.get(task_id)
+                    if entry is None or task is None:
+                        continue
+                    future, schedule = entry
+                    if task.get("status") in TERMINAL_STATUSES:
+                        del self._waiting[task_id]
+                        if not future.done():
+                            future.set_result(task)
+                    else:
+                        schedule.update(task.get("progress"), now)
+        except asyncio.CancelledError:
+            self._fail(None)
+            raise
+        except Exception as exc:
+            self._fail(exc)
+
+
+# === Pipeline ===
+
+# Keys a finished download task may report the local media file under.
+MEDIA_PATH_KEYS = ("audio_path", "video_path", "file_path", "output_path", "filepath", "path")
+
+
+def _media_path(result: Dict[str, Any]) -> str:
+    """Local file path from a download task result."""
+    for scope in [result] + [v for v in result.values() if isinstance(v, dict)]:
+        for key in MEDIA_PATH_KEYS:
+            if isinstance(scope.get(key), str) and scope[key]:
+                return scope[key]
+    raise ValueError(f"download result has no media path (keys: {sorted(result)})")
+
+
+class PipelineStage:
+    """
+    One step of a Pipeline.
+    
+    Args:
+        name: Stage name; its result is stored under this key in the video
+        run: Coroutine function (pipeline, video) -> result, where video is
+            the dict with "url", any caller-supplied fields and the results
+            of earlier stages
+        concurrency: Videos allowed in this stage at the same time
+        after: Names of stages that must finish first (default: the
+            previous stage in the list)
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        run: Callable[["Pipeline", Dict[str, Any]], Awaitable[Any]],
+        concurrency: int = 1,
+        after: Optional[List[str]] = None
+    ):
+        self.name = name
+        self.run = run
+        self.concurrency = max(1, concurrency)
+        self.after = after
+
+
+def pipeline_stages(
+    target_language: Optional[str] = "zh",
+    format: str = "best",
+    output_path: Optional[str] = None,
+    model: str = "base",
+    device: str = "cpu",
+    language: Optional[str] = None,
+    download_concurrency: int = 4,
+    transcribe_concurrency: int = 1,
+    translate_concurrency: int = 4
+) -> List[PipelineStage]:
+    """
+    The standard download -> transcribe -> translate stage list.
+    
+    Translation is left out when target_language is None; otherwise each
+    video's subtitles are translated as parallel chunks through the
+    translation memory (translate_subtitles_chunked). Downloads are
+    network bound and transcription is CPU/GPU bound, hence the different
+    default concurrency limits.
+    """
+    async def download(pipeline: "Pipeline", video: Dict[str, Any]) -> Dict[str, Any]:
+        submitted = await pipeline.client.download_media(video["url"], format, output_path)
+        return await pipeline.wait(submitted["task_id"])
+    
+    async def transcribe(pipeline: "Pipeline", video: Dict[str, Any]) -> Dict[str, Any]:
+        submitted = await pipeline.client.transcribe_audio(
+            _media_path(video["download"]), model, device, language
+        )
+        return await pipeline.wait(submitted["task_id"])
+    
+    async def translate(pipeline: "Pipeline", video: Dict[str, Any]) -> Dict[str, Any]:
+        return await pipeline.client.translate_subtitles_chunked(
+            video["transcribe"]["segments"], target_language
+        )
+    
+    stages = [
+        PipelineStage("download", download, download_concurrency),
+        PipelineStage("transcribe", transcribe, transcribe_concurrency),
+    ]
+    if target_language:
+        stages.append(PipelineStage("translate", translate, translate_concurrency))
+    return stages
+
+
+class Pipeline:
+    """
+    Runs a stage graph over many videos, overlapping stages across videos.
+    
+    Every video moves through the stages on its own, limited only by each
+    stage's concurrency, so video B downloads while video A transcribes.
+    Backend tasks started by stages are awaited through one shared poller
+    that resolves all of them with a single list_tasks() sweep per round.
+    A failing stage stops that video only.
+    """
+    
+    def __init__(
+        self,
+        client: MediaFlowClient,
+        stages: List[PipelineStage],
+        initial_delay: float = POLL_INITIAL_DELAY,
+        max_delay: float = POLL_MAX_DELAY
+    ):
+        self.client = client
+        self.stages, self.after = self._order(stages)
+        self._waiter = _TaskWaiter(client, initial_delay, max_delay)
+    
+    @staticmethod
+    def _order(stages: List[PipelineStage]) -> tuple:
+        """Resolve default dependencies and sort stages topologically."""
+        after: Dict[str, List[str]] = {}
+        for index, stage in enumerate(stages):
+            if stage.name in after:
+                raise ValueError(f"duplicate pipeline stage {stage.name!r}")
+            if stage.after is None:
+                after[stage.name] = [stages[index - 1].name] if index else []
+            else:
+                after[stage.name] = list(stage.after)
+        ordered, placed = [], set()
+        while len(ordered) < len(stages):
+            ready = [
+                stage for stage in stages
+                if stage.name not in placed and all(dep in placed for dep in after[stage.name])
+            ]
+            if not ready:
+                unknown = {dep for deps in after.values() for dep in deps} - set(after)
+                raise ValueError(
+                    f"unknown pipeline stage(s) {sorted(unknown)}" if unknown
+                    else "pipeline stages form a cycle"
+                )
+            ordered.extend(ready)
+            placed.update(stage.name for stage in ready)
+        return ordered, after
+    
+    async def wait(self, task_id: str) -> Dict[str, Any]:
+        """
+        Wait for a backend task started by a stage and return its result.
+        
+        Raises:
+            RuntimeError: if the task failed or was cancelled
+        """
+        return await self._waiter.result(task_id)
+    
+    async def run(self, videos: Iterable[Any]) -> Dict[str, Any]:
+        """
+        Run every video through the stages.
+        
+        Args:
+            videos: URLs, or dicts with a "url" key plus any extra fields
+                custom stages need
+                
+        Returns:
+            Dict with:
+              videos: per video (input order) index, url, outputs (stage
+                  name -> result), error and failed_stage
+              stages: per stage completed, failed, busy_seconds (summed
+                  time inside the stage), wall_seconds (first start to last
+                  finish), avg_seconds and per_minute throughput
+              seconds: total wall time
+        """
+        loop = asyncio.get_running_loop()
+        limits = {stage.name: asyncio.Semaphore(stage.concurrency) for stage in self.stages}
+        stats = {
+            stage.name: {"completed": 0, "failed": 0, "busy_seconds": 0.0,
+                         "first_start": None, "last_end": None}
+            for stage in self.stages
+        }
+        
+        async def run_video(index: int, video: Any) -> Dict[str, Any]:
+            video = {"url": video} if isinstance(video, str) else dict(video)
+            report = {"index": index, "url": video["url"], "outputs": {},
+                      "error": None, "failed_stage": None}
+            done: Dict[str, asyncio.Future] = {}
+            
+            async def run_stage(stage: PipelineStage) -> None:
+                for dep in self.after[stage.name]:
+                    await done[dep]
+                async with limits[stage.name]:
+                    stat = stats[stage.name]
+                    start = loop.time()
+                    if stat["first_start"] is None:
+                        stat["first_start"] = start
+                    try:
+                        video[stage.name] = await stage.run(self, video)
+                    except Exception as exc:
+                        stat["failed"] += 1
+                        if report["error"] is None:
+                            report["error"] = str(exc) or type(exc).__name__
+                            report["failed_stage"] = stage.name
+                        raise
+                    else:
+                        stat["completed"] += 1
+                        report["outputs"][stage.name] = video[stage.name]
+                    finally:
+                        stat["busy_seconds"] += loop.time() - start
+                        stat["last_end"] = loop.time()
+            
+            for stage in self.stages:
+                done[stage.name] = asyncio.ensure_future(run_stage(stage))
+            await asyncio.gather(*done.values(), return_exceptions=True)
+            return report
+        
+        started = loop.time()
+        try:
+            reports = await asyncio.gather(
+                *(run_video(index, video) for index, video in enumerate(videos))
+            )
+        finally:
+            self._waiter.close()
+        stages = {}
+        for name, stat in stats.items():
+            wall = 0.0
+            if stat["first_start"] is not None:
+                wall = stat["last_end"] - stat["first_start"]
+            completed = stat["completed"]
+            stages[name] = {
+                "completed": completed,
+                "failed": stat["failed"],
+                "busy_seconds": round(stat["busy_seconds"], 3),
+                "wall_seconds": round(wall, 3),
+                "avg_seconds": round(stat["busy_seconds"] / completed, 3) if completed else None,
+                "per_minute": round(completed / wall * 60, 2) if wall > 0 else None,
+            }
+        return {"videos": list(reports), "stages": stages,
+                "seconds": round(loop.time() - started, 3)}
 
 
 # Global client instance
@@ -187,27 +1461,39 @@ _client: Optional[MediaFlowClient] = None
 
 
 def get_client() -> MediaFlowClient:
-    """Get or create MediaFlow client."""
+    """Get or create MediaFlow client; all tool calls share its pool."""
     global _client
     if _client is None:
-        _client = MediaFlowClient()
+        _client = MediaFlowClient(
+            analyze_cache=AnalyzeCache() if ANALYZE_CACHE_TTL > 0 else None,
+            translation_memory=(
+                TranslationMemory() if TRANSLATION_MEMORY_MAX_ENTRIES > 0 else None
+            )
+        )
     return _client
 
 
+async def close_client() -> None:
+    """Close the shared client's connection pool."""
+    if _client is not None:
+        await _client.close()
+
+
 # === Tool Implementations ===
 
-async def analyze_url(url: str) -> Dict[str, Any]:
+async def analyze_url(url: str, refresh: bool = False) -> Dict[str, Any]:
     """
     Analyze a URL to extract metadata (title, duration, thumbnail).
     
     Args:
         url: URL to analyze
+        refresh: Bypass the local analyze cache
         
     Returns:
         Dict with url, title, thumbnail, duration, platform, is_video
     """
     client = get_client()
-    return await client.analyze_url(url)
+    return await client.analyze_url(url, refresh)
 
 
 async def download_media(
@@ -230,6 +1516,90 @@ async def download_media(
     return await client.download_media(url, format, output_path)
 
 
+def analyze_many(
+    urls: List[str],
+    concurrency: int = BATCH_CONCURRENCY,
+    rate: Optional[float] = BATCH_RATE
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Analyze many URLs concurrently (async for), bounded and rate limited.
+    
+    Args:
+        urls: URLs to analyze
+        concurrency: Maximum requests in flight
+        rate: Maximum requests started per second (None: unlimited)
+        
+    Yields:
+        Dict with index, url, result and error, in completion order
+    """
+    client = get_client()
+    return client.analyze_many(urls, concurrency, rate)
+
+
+def download_many(
+    urls: List[str],
+    format: str = "best",
+    output_path: Optional[str] = None,
+    concurrency: int = BATCH_CONCURRENCY,
+    rate: Optional[float] = BATCH_RATE
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Submit downloads for many URLs concurrently (async for).
+    
+    Args:
+        urls: Media URLs to download
+        format: Quality format (best, 4k, 2k, 1080p, 720p, 480p, audio)
+        output_path: Output directory path
+        concurrency: Maximum requests in flight
+        rate: Maximum requests started per second (None: unlimited)
+        
+    Yields:
+        Dict with index, url, result (task_id, status) and error,
+        in completion order
+    """
+    client = get_client()
+    return client.download_many(urls, format, output_path, concurrency, rate)
+
+
+async def run_pipeline(
+    urls: List[str],
+    target_language: Optional[str] = "zh",
+    format: str = "best",
+    output_path: Optional[str] = None,
+    model: str = "base",
+    device: str = "cpu",
+    language: Optional[str] = None,
+    download_concurrency: int = 4,
+    transcribe_concurrency: int = 1,
+    translate_concurrency: int = 4
+) -> Dict[str, Any]:
+    """
+    Download, transcribe and translate many videos, overlapping the stages.
+    
+    Args:
+        urls: Video URLs
+        target_language: Translation target (None: stop after transcription)
+        format: Download quality format
+        output_path: Download directory
+        model: Whisper model
+        device: Transcription device (cpu, cuda)
+        language: Source language code (default: auto-detect)
+        download_concurrency: Downloads running at once
+        transcribe_concurrency: Transcriptions running at once
+        translate_concurrency: Translations running at once
+        
+    Returns:
+        Dict with videos (per-video outputs and errors), stages (per-stage
+        counts, timings and throughput) and seconds (total wall time)
+    """
+    client = get_client()
+    stages = pipeline_stages(
+        target_language, format, output_path, model, device, language,
+        download_concurrency, transcribe_concurrency, translate_concurrency
+    )
+    return await Pipeline(client, stages).run(urls)
+
+
 async def transcribe_audio(
     audio_path: str,
     model: str = "base",
@@ -280,6 +1650,59 @@ async def translate_subtitles(
     )
 
 
+async def translate_subtitles_chunked(
+    segments: List[Dict[str, Any]],
+    target_language: str,
+    provider: str = "openai",
+    mode: str = "standard",
+    chunk_tokens: int = TRANSLATE_CHUNK_TOKENS,
+    overlap: int = TRANSLATE_CHUNK_OVERLAP,
+    concurrency: int = TRANSLATE_CONCURRENCY,
+    source_language: Optional[str] = None,
+    use_memory: bool = True
+) -> Dict[str, Any]:
+    """
+    Translate long subtitles as parallel chunks and wait for the result.
+    
+    Lines already in the translation memory are served locally and repeated
+    lines are sent once.
+    
+    Args:
+        segments: List of SubtitleSegment objects with start, end, text
+        target_language: Target language (e.g., zh, en, ja, ko)
+        provider: LLM provider (openai)
+        mode: Translation mode (standard, reflect)
+        chunk_tokens: Approximate token budget per chunk
+        overlap: Context segments sent on each side of a chunk
+        concurrency: Chunks translated at the same time
+        source_language: Source language code (default: auto)
+        use_memory: Consult and update the translation memory
+        
+    Returns:
+        Dict with status, segments (translated, in timestamp order), chunks,
+        task_ids, failed_chunks and memory (hit rate and saved calls)
+    """
+    client = get_client()
+    return await client.translate_subtitles_chunked(
+        segments, target_language, provider, mode, chunk_tokens, overlap,
+        concurrency, source_language=source_language, use_memory=use_memory
+    )
+
+
+async def translation_memory_stats() -> Dict[str, Any]:
+    """
+    Report translation memory usage since the skill was loaded.
+    
+    Returns:
+        Dict with lookups, hits, misses, hit_rate, saved_calls and entries
+        (empty if the memory is disabled)
+    """
+    client = get_client()
+    if client.translation_memory is None:
+        return {}
+    return await asyncio.to_thread(client.translation_memory.stats)
+
+
 async def get_task_status(task_id: str) -> Dict[str, Any]:
     """
     Get the status of a background task.
@@ -309,3 +1732,54 @@ async def health_check() -> Dict[str, Any]:
     """Check if MediaFlow backend is running."""
     client = get_client()
     return await client.health_check()
+
+
+async def wait_for_task(task_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Wait for a background task to complete, fail or be cancelled.
+    
+    Args:
+        task_id: Task ID to wait for
+        timeout: Seconds to wait before giving up (default: no limit)
+        
+    Returns:
+        Final task object (id, status, progress, result, error)
+    """
+    client = get_client()
+    return await client.wait_for_task(task_id, timeout)
+
+
+async def wait_for_many(
+    task_ids: List[str],
+    timeout: Optional[float] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Wait for several background tasks with one list_tasks() sweep per poll.
+    
+    Args:
+        task_ids: Task IDs to wait for
+        timeout: Seconds to wait before giving up (default: no limit)
+        
+    Returns:
+        Dict mapping each task ID to its final task object
+    """
+    client = get_client()
+    return await client.wait_for_many(task_ids, timeout)
+
+
+def iter_completed(
+    task_ids: List[str],
+    timeout: Optional[float] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Iterate over background tasks as they finish (async for).
+    
+    Args:
+        task_ids: Task IDs to wait for
+        timeout: Seconds to wait before giving up (default: no limit)
+        
+    Yields:
+        Final task objects, in completion order
+    """
+    client = get_client()
+    return client.iter_completed(task_ids, timeout)
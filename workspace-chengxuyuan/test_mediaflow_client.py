@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+"""Offline tests for the MediaFlow skill client, against an in-memory backend."""
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "skills"))
+
+import MediaFlow  # noqa: E402
+
+
+class FakeClient(MediaFlow.MediaFlowClient):
+    """MediaFlowClient whose HTTP layer is an in-memory task backend.
+
+    Tasks finish `duration` seconds after submission, reporting linear
+    progress until then. `list_delay` slows down list_tasks() responses.
+    """
+
+    def __init__(self, duration=0.05, list_delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.duration = duration
+        self.list_delay = list_delay
+        self.tasks = {}
+        self.calls = collections.Counter()
+        self.unlisted = set()
+        self.translated = []  # segment lists sent to /translate/
+        self._ids = iter(range(1_000_000))
+        self.analyze_errors = {}  # URL substring -> exception to raise
+
+    def add_task(self, task_id, duration=None, status="completed", result=None):
+        self.tasks[task_id] = {
+            "id": task_id, "t0": time.monotonic(),
+            "duration": self.duration if duration is None else duration,
+            "final": status, "result": result or {},
+        }
+        return {"task_id": task_id, "status": "pending"}
+
+    def _view(self, task):
+        done = time.monotonic() - task["t0"] >= task["duration"]
+        progress = 100.0 if done else (time.monotonic() - task["t0"]) / task["duration"] * 100
+        return {
+            "id": task["id"],
+            "status": task["final"] if done else "running",
+            "progress": progress,
+            "result": task["result"] if done else None,
+            "error": "boom" if done and task["final"] == "failed" else None,
+        }
+
+    async def _request(self, method, endpoint, **kwargs):
+        if endpoint == "/api/v1/tasks/":
+            self.calls["list"] += 1
+            # The listing reflects the backend when the request arrived.
+            listing = [self._view(t) for t in self.tasks.values() if t["id"] not in self.unlisted]
+            await asyncio.sleep(self.list_delay)
+            return listing
+        if endpoint.startswith("/api/v1/tasks/"):
+            self.calls["status"] += 1
+            return self._view(self.tasks[endpoint.rsplit("/", 1)[1]])
+        if endpoint == "/api/v1/analyze/":
+            url = kwargs["json"]["url"]
+            self.calls["analyze"] += 1
+            await asyncio.sleep(0.01)
+            for marker, exc in self.analyze_errors.items():
+                if marker in url:
+                    raise exc
+            return {"url": url, "title": "title of " + url, "platform": "test", "is_video": True}
+        if endpoint == "/api/v1/translate/":
+            self.calls["translate"] += 1
+            segments = kwargs["json"]["segments"]
+            self.translated.append(segments)
+            result = {"segments": [dict(seg, text="ZH:" + seg["text"]) for seg in segments]}
+            return self.add_task(f"tr{next(self._ids)}", result=result)
+        raise AssertionError(f"unexpected request {method} {endpoint}")
+
+
+def run(coro, timeout=5):
+    return asyncio.run(asyncio.wait_for(coro, timeout))
+
+
+# === user-019: shared connection pool ===
+
+def test_pool_is_shared_and_reopened():
+    client = MediaFlow.MediaFlowClient(max_connections=7, max_keepalive_connections=3)
+
+    async def main():
+        pools = await asyncio.gather(*(client.open() for _ in range(20)))
+        assert all(pool is pools[0] for pool in pools)
+        await client.close()
+        assert pools[0].is_closed
+        reopened = await client.open()
+        assert reopened is not pools[0]
+        return reopened
+    first = asyncio.run(main())
+    # A new event loop gets its own pool.
+    second = asyncio.run(client.open())
+    assert second is not first
+    assert client.limits.max_connections == 7 and client.limits.max_keepalive_connections == 3
+
+
+def test_pool_is_closed_on_the_loop_that_opened_it():
+    client = MediaFlow.MediaFlowClient()
+    # asyncio.run closes a pool left open while it shuts its loop down.
+    first = asyncio.run(client.open())
+    assert first.is_closed
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        pool = asyncio.run_coroutine_threadsafe(client.open(), loop).result(5)
+        asyncio.run(client.close())  # from a loop that doesn't own the pool
+        deadline = time.monotonic() + 5
+        while not pool.is_closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def test_client_context_manager_closes_pool():
+    async def main():
+        async with MediaFlow.MediaFlowClient() as client:
+            pool = await client.open()
+            assert not pool.is_closed
+        return pool
+    assert asyncio.run(main()).is_closed
+
+
+def test_get_client_is_a_singleton():
+    assert MediaFlow.get_client() is MediaFlow.get_client()
+
+
+# === user-020: task polling ===
+
+def test_poll_schedule_backs_off_and_follows_eta():
+    schedule = MediaFlow._PollSchedule(0.5, 10.0)
+    assert schedule.update(0.0, 0.0) == 0.5
+    assert schedule.update(0.0, 1.0) == 1.0  # stalled: double
+    assert schedule.update(0.0, 2.0) == 2.0
+    assert schedule.update(None, 3.0) == 4.0
+    # 0 -> 40% in 4 s: 60% left at 10%/s, check again in half of 6 s.
+    assert schedule.update(40.0, 4.0) == 3.0
+    assert schedule.update(99.0, 5.0) == 0.5  # nearly done: clamp to minimum
+    for now in range(6, 20):
+        delay = schedule.update(99.0, float(now))
+    assert delay == 10.0
+
+
+def test_iter_completed_sweeps_once_per_round():
+    async def main():
+        client = FakeClient()
+        for index, duration in enumerate([0.3, 0.05, 0.15, 0.05]):
+            client.add_task(f"t{index}", duration=duration)
+        order = [task["id"] async for task in client.iter_completed(
+            ["t0", "t1", "t2", "t3"], initial_delay=0.02, max_delay=0.1)]
+        return order, client.calls
+    order, calls = run(main())
+    assert order[-1] == "t0" and set(order[:2]) == {"t1", "t3"}
+    assert calls["status"] == 0 and calls["list"] < 4 * 5
+
+
+def test_sweep_falls_back_to_status_for_unlisted_tasks():
+    async def main():
+        client = FakeClient(duration=0)
+        client.add_task("listed")
+        client.add_task("hidden", status="failed")
+        client.unlisted.add("hidden")
+        done = await client.wait_for_many(["hidden", "listed"], initial_delay=0.01)
+        return done, client.calls
+    done, calls = run(main())
+    assert list(done) == ["hidden", "listed"]
+    assert done["hidden"]["status"] == "failed" and done["hidden"]["error"] == "boom"
+    assert calls["list"] == 1 and calls["status"] == 1
+
+
+def test_wait_timeouts():
+    async def main():
+        client = FakeClient(duration=10)
+        client.add_task("slow")
+        outcomes = []
+        for wait in (client.wait_for_task("slow", timeout=0.1, initial_delay=0.02),
+                     client.wait_for_many(["slow"], timeout=0.1, initial_delay=0.02)):
+            try:
+                await wait
+            except asyncio.TimeoutError:
+                outcomes.append("timeout")
+        return outcomes
+    assert run(main()) == ["timeout", "timeout"]
+
+
+def test_wait_for_task_returns_final_state():
+    async def main():
+        client = FakeClient()
+        client.add_task("t", duration=0.1, result={"segments": []})
+        return await client.wait_for_task("t", initial_delay=0.02)
+    task = run(main())
+    assert task["status"] == "completed" and task["result"] == {"segments": []}
+
+
+# === user-023: shared task poller ===
+
+def test_waiter_registering_mid_sweep():
+    """A task registered while a slow sweep is in flight still resolves."""
+    async def main():
+        client = FakeClient(duration=0.05, list_delay=0.3)
+        waiter = MediaFlow._TaskWaiter(client, initial_delay=0.01, max_delay=0.05)
+        client.add_task("A")
+        first = asyncio.ensure_future(waiter.result("A"))
+        await asyncio.sleep(0.1)  # the first sweep is now in flight
+        client.add_task("B")
+        second = asyncio.ensure_future(waiter.result("B"))
+        return await asyncio.gather(first, second)
+    assert run(main()) == [{}, {}]
+
+
+def test_waiter_fails_outstanding_futures_on_sweep_error():
+    class Broken(FakeClient):
+        async def list_tasks(self):
+            raise RuntimeError("backend down")
+
+    async def main():
+        waiter = MediaFlow._TaskWaiter(Broken(), initial_delay=0.01)
+        try:
+            await waiter.wait("A")
+        except RuntimeError as exc:
+            return str(exc)
+    assert run(main()) == "backend down"
+
+
+def test_pipeline_overlaps_and_reports_failures():
+    async def main():
+        client = FakeClient()
+        counter = iter(range(100))
+
+        async def step(pipeline, video):
+            if video["url"] == "bad":
+                raise ValueError("no such video")
+            return await pipeline.wait(client.add_task(f"t{next(counter)}", result={"ok": 1})["task_id"])
+
+        stages = [
+            MediaFlow.PipelineStage("a", step, concurrency=3),
+            MediaFlow.PipelineStage("b", step, concurrency=1),
+        ]
+        pipeline = MediaFlow.Pipeline(client, stages, initial_delay=0.01, max_delay=0.05)
+        return await pipeline.run(["v1", "bad", "v2", "v3"])
+    report = run(main())
+    assert [v["error"] for v in report["videos"]] == [None, "no such video", None, None]
+    assert report["videos"][1]["failed_stage"] == "a"
+    assert report["stages"]["a"]["completed"] == 3 and report["stages"]["a"]["failed"] == 1
+    assert report["stages"]["b"]["completed"] == 3
+
+
+
+# === user-024: chunked parallel translation ===
+
+def _segments(n, text="line {}"):
+    return [{"start": float(i), "end": i + 1.0, "text": text.format(i)} for i in range(n)]
+
+
+def test_chunks_cover_every_segment_once():
+    segments = _segments(50, "a sentence of several words, number {}")
+    chunks = MediaFlow.chunk_segments(segments, max_tokens=60, overlap=2)
+    assert len(chunks) > 1
+    own = [i for _, start, end, _ in chunks for i in range(start, end)]
+    assert own == list(range(50))
+    for lo, start, end, hi in chunks:
+        assert lo == max(0, start - 2) and hi == min(50, end + 2)
+
+
+def test_chunked_translation_more_chunks_than_concurrency():
+    """Chunks submitted mid-sweep (the old poller hang) still complete."""
+    async def main():
+        client = FakeClient(duration=0.05, list_delay=0.1)
+        segments = _segments(20, "a sentence of several words, number {}")[::-1]
+        return client, await client.translate_subtitles_chunked(
+            segments, "zh", chunk_tokens=60, overlap=1, concurrency=2
+        )
+    client, result = run(main(), timeout=20)
+    assert result["status"] == "completed" and result["chunks"] > 2
+    assert [seg["start"] for seg in result["segments"]] == [float(i) for i in range(20)]
+    assert all(seg["text"].startswith("ZH:") for seg in result["segments"])
+    # Overlap: each chunk is sent with the last line of the chunk before it.
+    sent = sorted(client.translated, key=lambda segs: segs[0]["start"])
+    assert all(nxt[0]["start"] <= prev[-1]["start"] - 1 for prev, nxt in zip(sent, sent[1:]))
+
+
+def test_chunked_translation_timeout_stops_polling():
+    async def main():
+        client = FakeClient(duration=30)
+        try:
+            await client.translate_subtitles_chunked(_segments(5), "zh", timeout=0.3)
+        except asyncio.TimeoutError:
+            pass
+        polls = client.calls["list"]
+        await asyncio.sleep(1.2)
+        return polls, client.calls["list"]
+    before, after = run(main())
+    assert before == after
+
+
+def test_pipeline_translate_stage_is_chunked():
+    async def main():
+        client = FakeClient(duration=0.01)
+        stage = next(s for s in MediaFlow.pipeline_stages("zh") if s.name == "translate")
+        pipeline = MediaFlow.Pipeline(client, [stage], initial_delay=0.01, max_delay=0.05)
+        segments = _segments(200, "a sentence of several words, number {}")
+        return client, await stage.run(pipeline, {"url": "v", "transcribe": {"segments": segments}})
+    client, result = run(main(), timeout=20)
+    assert result["status"] == "completed" and result["chunks"] == client.calls["translate"] > 1
+    assert all(seg["text"].startswith("ZH:") for seg in result["segments"])
+
+
+# === user-025: translation memory ===
+
+class ThreadRecordingMemory(MediaFlow.TranslationMemory):
+    threads = set()
+
+    def lookup(self, *args):
+        self.threads.add(threading.current_thread() is threading.main_thread())
+        return super().lookup(*args)
+
+
+def _memory_client(tmp_path, **kwargs):
+    memory = ThreadRecordingMemory(str(tmp_path / "tm.sqlite"))
+    return FakeClient(translation_memory=memory, **kwargs), memory
+
+
+def test_memory_sends_misses_with_real_neighbours(tmp_path):
+    client, memory = _memory_client(tmp_path)
+    memory.store({"line 4": "MEM4", "line 5": "MEM5", "line 6": "MEM6"}, "auto", "zh", "standard")
+
+    async def main():
+        return await client.translate_subtitles_chunked(
+            _segments(12), "zh", chunk_tokens=30, overlap=1
+        )
+    result = run(main(), timeout=20)
+    texts = [seg["text"] for seg in result["segments"]]
+    assert texts[4:7] == ["MEM4", "MEM5", "MEM6"]
+    assert texts[3] == "ZH:line 3" and texts[7] == "ZH:line 7"
+    # Line 7's chunk carries line 6 (a hit) as context, not line 3.
+    chunk = next(sent for sent in client.translated if sent[1]["text"] == "line 7")
+    assert chunk[0]["text"] == "line 6"
+    assert result["memory"]["hits"] == 3 and result["memory"]["sent"] == 9
+    assert ThreadRecordingMemory.threads == {False}
+
+
+def test_memory_dedups_and_skips_fully_known_chunks(tmp_path):
+    client, memory = _memory_client(tmp_path)
+    segments = _segments(6, "subscribe")
+
+    async def main():
+        first = await client.translate_subtitles_chunked(segments, "zh", chunk_tokens=20)
+        calls = client.calls["translate"]
+        second = await client.translate_subtitles_chunked(segments, "zh", chunk_tokens=20)
+        return first, calls, second
+    first, calls, second = run(main(), timeout=20)
+    assert calls == 1 and first["memory"]["sent"] == 1 and first["memory"]["duplicates"] == 5
+    assert [seg["text"] for seg in first["segments"]] == ["ZH:subscribe"] * 6
+    assert client.calls["translate"] == 1
+    assert second["memory"]["hit_rate"] == 1.0
+    assert second["memory"]["saved_calls"] == len(MediaFlow.chunk_segments(segments, 20))
+    assert memory.stats()["saved_calls"] == first["memory"]["saved_calls"] + second["memory"]["saved_calls"]
+
+
+def test_memory_does_not_learn_failed_chunks(tmp_path):
+    class Flaky(FakeClient):
+        async def translate_subtitles(self, segments, *args):
+            if any(seg["text"] == "line 9" for seg in segments):
+                raise RuntimeError("backend error")
+            return await super().translate_subtitles(segments, *args)
+
+    memory = MediaFlow.TranslationMemory(str(tmp_path / "tm.sqlite"))
+    client = Flaky(translation_memory=memory)
+
+    async def main():
+        return await client.translate_subtitles_chunked(_segments(10), "zh", chunk_tokens=30, overlap=0)
+    result = run(main(), timeout=20)
+    assert result["status"] == "partial"
+    assert result["segments"][9]["text"] == "line 9"
+    assert "line 9" not in memory.lookup(["line 9"], "auto", "zh", "standard")
+    assert "line 0" in memory.lookup(["line 0"], "auto", "zh", "standard")
+
+
+def test_memory_stats_tool_runs_off_the_loop(tmp_path, monkeypatch):
+    class Recording(MediaFlow.TranslationMemory):
+        threads = set()
+
+        def stats(self):
+            self.threads.add(threading.current_thread() is threading.main_thread())
+            return super().stats()
+
+    monkeypatch.setattr(MediaFlow, "_client", FakeClient(translation_memory=Recording(str(tmp_path / "tm.sqlite"))))
+    stats = run(MediaFlow.translation_memory_stats())
+    assert stats["entries"] == 0 and Recording.threads == {False}
+
+
+# === user-022: analyze cache ===
+
+def test_normalize_url_trackers_are_per_host():
+    norm = MediaFlow.normalize_url
+    assert norm("https://www.bilibili.com/video/BV1xx?p=2&spm_id_from=333&vd_source=ab") == \
+        "https://bilibili.com/video/BV1xx?p=2"
+    assert norm("https://youtu.be/abc?si=x&t=42") == "https://youtube.com/watch?v=abc"
+    assert norm("http://m.youtube.com/watch?v=abc&pp=yg&feature=share#c") == \
+        "https://youtube.com/watch?v=abc"
+    # Only utm_* and click IDs are stripped on hosts without a tracker list.
+    assert norm("https://example.com/p?ref=home&feature=x&pp=1&utm_source=t&fbclid=z") == \
+        "https://example.com/p?feature=x&pp=1&ref=home"
+
+
+def test_normalize_url_without_scheme_or_with_a_bad_port():
+    norm = MediaFlow.normalize_url
+    assert norm("youtu.be/abc") == norm("https://youtu.be/abc") == "https://youtube.com/watch?v=abc"
+    assert norm("example.com:8080/a/") == "https://example.com:8080/a"
+    assert norm("https://example.com:99999/a") == "https://example.com:99999/a"
+    assert norm("https://Example.com:abc/a") == "https://example.com:abc/a"
+
+
+def test_analyze_cache_lookup_is_off_the_loop(tmp_path):
+    class Recording(MediaFlow.AnalyzeCache):
+        threads = set()
+
+        def get(self, key):
+            self.threads.add(threading.current_thread() is threading.main_thread())
+            return super().get(key)
+
+    async def main():
+        client = FakeClient(analyze_cache=Recording(str(tmp_path)))
+        await client.analyze_url("https://example.com/v")
+        return await client.analyze_url("https://example.com/v"), client.calls["analyze"]
+    result, calls = run(main())
+    assert calls == 1 and result["title"] == "title of https://example.com/v"
+    assert Recording.threads == {False}
+
+
+def test_analyze_cache_coalesces_and_persists(tmp_path):
+    async def main():
+        client = FakeClient(analyze_cache=MediaFlow.AnalyzeCache(str(tmp_path)))
+        urls = ["https://youtu.be/abc?si=1", "https://www.youtube.com/watch?v=abc"] * 5
+        results = await asyncio.gather(*(client.analyze_url(url) for url in urls))
+        other = FakeClient(analyze_cache=MediaFlow.AnalyzeCache(str(tmp_path)))
+        again = await other.analyze_url("https://youtube.com/watch?v=abc&feature=share")
+        refreshed = await other.analyze_url("https://youtube.com/watch?v=abc", refresh=True)
+        return client.calls["analyze"], results, other.calls["analyze"], again, refreshed
+    calls, results, other_calls, again, refreshed = run(main())
+    assert calls == 1 and all(result == results[0] for result in results)
+    assert again == results[0] and other_calls == 1 and refreshed["url"].endswith("v=abc")
+
+
+def test_analyze_cache_ttl(tmp_path):
+    cache = MediaFlow.AnalyzeCache(str(tmp_path), ttl=0.05)
+    cache.put("k", {"title": "t"})
+    assert cache.get("k") == {"title": "t"}
+    time.sleep(0.1)
+    assert cache.get("k") is None
+
+
+def test_analyze_cache_evicts_in_batches(tmp_path):
+    class Counting(MediaFlow.AnalyzeCache):
+        scans = 0
+
+        def _evict(self):
+            Counting.scans += 1
+            super()._evict()
+
+    cache = Counting(str(tmp_path), max_entries=20)
+    for index in range(60):
+        cache.put(f"k{index}", {"i": index})
+        assert len(os.listdir(cache.directory)) <= 20
+    assert Counting.scans <= 60 // (20 - int(20 * cache.EVICT_TO))
+    assert cache.get("k59") == {"i": 59} and cache.get("k0") is None
+
+
+
+# === user-021: batch calls ===
+
+def test_analyze_many_reports_per_item_errors():
+    async def main():
+        client = FakeClient()
+        client.analyze_errors = {"bad-key": KeyError("title"), "bad-rt": RuntimeError("odd reply")}
+        urls = [f"https://example.com/{i}" for i in range(8)] + ["https://example.com/bad-key",
+                                                                  "https://example.com/bad-rt"]
+        return [item async for item in client.analyze_many(urls, concurrency=3, rate=None)]
+    items = run(main())
+    assert sorted(item["index"] for item in items) == list(range(10))
+    errors = {item["url"].rsplit("/", 1)[1]: item["error"] for item in items if item["error"]}
+    assert errors == {"bad-key": "'title'", "bad-rt": "odd reply"}
+
+
+def test_analyze_many_bounds_concurrency_and_rate():
+    async def main():
+        client = FakeClient()
+        active = peak = 0
+
+        async def call(url):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+            return {}
+        started = time.monotonic()
+        items = [item async for item in client._map_urls(call, map(str, range(12)), 3, 40.0)]
+        return peak, time.monotonic() - started, items
+    peak, elapsed, items = run(main())
+    assert peak <= 3 and len(items) == 12
+    assert elapsed >= (12 - 3) / 40.0 * 0.9  # burst of 3, then 40 per second
+
+
+def test_analyze_many_cancellation_propagates():
+    async def main():
+        client = FakeClient()
+
+        async def call(url):
+            await asyncio.sleep(10)
+
+        async def consume():
+            return [item async for item in client._map_urls(call, ["a", "b"], 2, None)]
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return "cancelled"
+    assert run(main()) == "cancelled"
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Offline tests for memory-abstract-gen.py, on copies of workspace files."""
+import importlib.util
+import itertools
+import json
+import math
+import os
+import shutil
+import sqlite3
+import sys
+from pathlib import Path
+
+HERE = Path(os.path.dirname(os.path.abspath(__file__)))
+WORKSPACE = HERE.parent / "workspace-baogongtou"
+
+_spec = importlib.util.spec_from_file_location("memory_abstract_gen", HERE / "memory-abstract-gen.py")
+mag = importlib.util.module_from_spec(_spec)
+sys.modules["memory_abstract_gen"] = mag  # worker processes unpickle functions by module name
+_spec.loader.exec_module(mag)
+
+CAT_POEMS = ["draft-cat-poem.md", "draft-cat-poem-v2.md"]
+HORSE_POEMS = [
+    "draft-horse-poem.md", "draft-horse-poem-v2.md", "draft-horse-poem2.md", "draft-horse-poem3.md",
+    "draft-horse-couplet.md", "draft-horse-year-greeting.md",
+]
+
+
+def _fingerprint(name):
+    return mag._document_features((WORKSPACE / name).read_text(encoding="utf-8"))[1]
+
+
+def _copy(tmp_path, names):
+    for name in names:
+        shutil.copy(WORKSPACE / name, tmp_path / name)
+    return tmp_path
+
+
+def _abstract(directory, name):
+    return json.loads((directory / name).with_suffix(".abstract").read_text(encoding="utf-8"))
+
+
+def _workspace(tmp_path, name):
+    """A copy of the workspace's Markdown tree, without generated files."""
+    dest = tmp_path / name
+    shutil.copytree(WORKSPACE, dest, ignore=shutil.ignore_patterns("*.abstract", ".*", "*.png", "*.txt", "*.json"))
+    return dest
+
+
+def _outputs(root):
+    """Every abstract and index under *root*, less what depends on where the tree is."""
+    out = {}
+    for path in sorted(root.rglob("*.abstract")):
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if path.name == "INDEX.abstract":
+            data.pop("directory")
+            data.pop("index_hash")
+            for sd in data.get("subdirectories", []):
+                sd.pop("index_hash")
+        out[path.relative_to(root).as_posix()] = data
+    return out
+
+
+def _stats(root):
+    """The tables of *root*'s corpus statistics database, sorted."""
+    conn = sqlite3.connect(str(root / mag.STATS_DB_NAME))
+    try:
+        return {
+            table: sorted(conn.execute(f"SELECT * FROM {table}"))
+            for table in ("files", "df", "sections", "rankings")
+        }
+    finally:
+        conn.close()
+
+
+APPENDED = "## 晚间补记\n\n新增的 Cron 任务全部通过检查。Telegram 与 Discord 的 Bot 均已重启。\n"
+
+
+# -- equivalence ------------------------------------------------------------
+
+
+def test_append_matches_a_cold_run(tmp_path, monkeypatch):
+    daily = "memory/2026-02-22.md"
+    warm = _workspace(tmp_path, "warm")
+    mag.run(warm, quiet=True, recursive=True, tiers=(50, 300))
+    before = {path: path.read_bytes() for path in warm.rglob("*.abstract") if path.name != "INDEX.abstract"}
+    with open(warm / daily, "a", encoding="utf-8") as f:
+        f.write(APPENDED)
+    tokenized = []
+    section_features = mag._section_features
+    monkeypatch.setattr(mag, "_section_features", lambda text: tokenized.append(text) or section_features(text))
+    mag.run(warm, quiet=True, recursive=True, tiers=(50, 300))
+    monkeypatch.undo()
+
+    cold = _workspace(tmp_path, "cold")
+    with open(cold / daily, "a", encoding="utf-8") as f:
+        f.write(APPENDED)
+    mag.run(cold, quiet=True, recursive=True, tiers=(50, 300))
+
+    # The appended file comes out as a cold run writes it...
+    assert _abstract(warm, daily) == _abstract(cold, daily)
+    entries = [
+        {e["file"]: e for e in json.loads((root / "memory/INDEX.abstract").read_text(encoding="utf-8"))["files"]}
+        for root in (warm, cold)
+    ]
+    assert entries[0]["2026-02-22.md"] == entries[1]["2026-02-22.md"]
+    # ...and no other abstract was rewritten.
+    appended = (warm / daily).with_suffix(".abstract")
+    assert {path: path.read_bytes() for path in before if path != appended} == {
+        path: data for path, data in before.items() if path != appended
+    }
+    warm_stats, cold_stats = _stats(warm), _stats(cold)
+    # Unchanged files keep the ranking they were scored with before the
+    # append shifted the document frequencies; the appended file's is fresh.
+    rankings = [{r[0]: r for r in stats.pop("rankings")} for stats in (warm_stats, cold_stats)]
+    assert warm_stats == cold_stats
+    assert rankings[0].keys() == rankings[1].keys()
+    assert rankings[0][daily] == rankings[1][daily]
+    # Only the appended section was tokenized again.
+    assert tokenized == [APPENDED]
+
+    # Section by section comes to the same as one pass over the whole file.
+    content = (warm / daily).read_text(encoding="utf-8")
+    conn = sqlite3.connect(str(warm / mag.STATS_DB_NAME))
+    try:
+        terms, fingerprint = conn.execute("SELECT terms, fingerprint FROM files WHERE path = ?", (daily,)).fetchone()
+        depth, ranked = conn.execute("SELECT depth, ranked FROM rankings WHERE path = ?", (daily,)).fetchone()
+        idf = mag._stats_idf(conn, [daily])[0]
+    finally:
+        conn.close()
+    assert (terms.split("\n"), fingerprint) == mag._document_features(content)
+    assert json.loads(ranked) == mag._rank_scan(mag._scan_markdown(content), depth, idf)
+
+
+def test_jobs_match_a_serial_run(tmp_path):
+    serial = _workspace(tmp_path, "serial")
+    mag.run(serial, quiet=True, recursive=True, dedup=True)
+    parallel = _workspace(tmp_path, "parallel")
+    mag.run(parallel, quiet=True, recursive=True, dedup=True, jobs=2)
+
+    assert _outputs(serial) == _outputs(parallel)
+    assert _stats(serial) == _stats(parallel)
+
+
+def test_many_roots_share_each_phase(tmp_path, monkeypatch):
+    roots = [_workspace(tmp_path / "many", name) for name in ("a", "b")]
+    (roots[1] / "memory" / "2026-02-22.md").unlink()
+    singles = [_workspace(tmp_path / "single", name) for name in ("a", "b")]
+    (singles[1] / "memory" / "2026-02-22.md").unlink()
+    for root in singles:
+        mag.run(root, quiet=True, recursive=True)
+
+    batches = []
+    pool_map = mag._pool_map
+    monkeypatch.setattr(mag, "_pool_map", lambda *args: batches.append(len(args[3])) or pool_map(*args))
+    mag.run_many(roots, quiet=True, recursive=True, jobs=2)
+    # One batch of checks and one of summaries, each over both roots.
+    assert batches == [sum(len(list(r.rglob("*.md"))) for r in roots)] * 2
+
+    for root, single in zip(roots, singles):
+        assert _outputs(root) == _outputs(single)
+        assert _stats(root) == _stats(single)
+
+
+def test_sqlite_export_matches_the_json_store(tmp_path):
+    files = _workspace(tmp_path, "json")
+    mag.run(files, quiet=True, recursive=True, tiers=(50,), dedup=True)
+    db = _workspace(tmp_path, "sqlite")
+    mag.run(db, quiet=True, recursive=True, tiers=(50,), dedup=True, store="sqlite")
+    assert not list(db.rglob("*.abstract"))
+    mag.export_store(db)
+
+    assert _outputs(files) == _outputs(db)
+    assert _stats(files) == _stats(db)
+
+
+def test_rerendered_abstracts_count_as_updated(tmp_path, capsys):
+    _copy(tmp_path, CAT_POEMS)
+    mag.run(tmp_path, quiet=True)
+    mag.run(tmp_path)
+    assert "0 updated, 2 skipped" in capsys.readouterr().out
+    mag.run(tmp_path, target_tokens=50)
+    out = capsys.readouterr().out
+    assert "2 updated, 0 skipped" in out
+    assert all(f"✓ {name} → " in out for name in CAT_POEMS)
+
+
+def test_process_file_returns_what_it_writes(tmp_path):
+    _copy(tmp_path, CAT_POEMS)
+    ab = mag.process_file(tmp_path / "draft-cat-poem.md", target_tokens=50, tiers=(50, 300))
+    assert not mag._has_ranking(ab)
+    assert ab == _abstract(tmp_path, "draft-cat-poem.md")
+
+
+# -- near-duplicates --------------------------------------------------------
+
+
+def test_threshold_separates_an_edit_from_rewrites():
+    # Three standard errors of the MinHash estimate on either side.
+    def margin(j):
+        return 3 * math.sqrt(j * (1 - j) / mag.MINHASH_BINS)
+
+    edit = mag._similarity(*map(_fingerprint, CAT_POEMS))
+    assert edit - margin(edit) >= mag.DUPLICATE_THRESHOLD
+
+    prints = {name: _fingerprint(name) for name in HORSE_POEMS}
+    for a, b in itertools.combinations(HORSE_POEMS, 2):
+        rewrite = mag._similarity(prints[a], prints[b])
+        assert rewrite + margin(rewrite) < mag.DUPLICATE_THRESHOLD, (a, b, rewrite)
+
+
+def test_dedup_is_off_by_default(tmp_path):
+    _copy(tmp_path, CAT_POEMS)
+    index = mag.run(tmp_path, quiet=True)
+    assert not any("duplicate_of" in e for e in index["files"])
+    assert "duplicate_of" not in _abstract(tmp_path, "draft-cat-poem.md")
+
+
+def test_dedup_marks_members_but_keeps_their_summaries(tmp_path):
+    _copy(tmp_path, CAT_POEMS + HORSE_POEMS)
+    plain = {e["file"]: e for e in mag.run(tmp_path, quiet=True)["files"]}
+    index = mag.run(tmp_path, quiet=True, dedup=True)
+
+    assert index["file_count"] == len(index["files"]) == len(CAT_POEMS + HORSE_POEMS)
+    marked = {e["file"]: e["duplicate_of"] for e in index["files"] if "duplicate_of" in e}
+    assert marked == {"draft-cat-poem.md": "draft-cat-poem-v2.md"}
+
+    member = _abstract(tmp_path, "draft-cat-poem.md")
+    assert member["duplicate_of"] == "draft-cat-poem-v2.md"
+    assert member["summary"] == plain["draft-cat-poem.md"]["summary"]
+    assert member["headings"] == ["猫年祝福诗"]
+
+    packed = mag.pack(tmp_path, budget=100_000)
+    assert "draft-cat-poem.md" not in {f["file"] for f in packed["files"]}
+
+    index = mag.run(tmp_path, quiet=True)
+    assert not any("duplicate_of" in e for e in index["files"])
+    assert "duplicate_of" not in _abstract(tmp_path, "draft-cat-poem.md")
+
+
+def test_representative_is_the_latest_version_by_name(tmp_path):
+    _copy(tmp_path, CAT_POEMS)
+    # Older version touched last, as after a checkout.
+    os.utime(tmp_path / "draft-cat-poem-v2.md", (1, 1))
+    mag.run(tmp_path, quiet=True, dedup=True)
+    assert _abstract(tmp_path, "draft-cat-poem.md")["duplicate_of"] == "draft-cat-poem-v2.md"
+    assert "duplicate_of" not in _abstract(tmp_path, "draft-cat-poem-v2.md")
+
+    assert sorted(["draft-v10", "draft", "draft-v2"], key=mag._version_key) == ["draft", "draft-v2", "draft-v10"]
+
+
+# -- pack -------------------------------------------------------------------
+
+
+def test_pack_falls_back_to_the_summary_of_an_unreadable_file(tmp_path):
+    _copy(tmp_path, CAT_POEMS + ["SOUL.md"])
+    mag.run(tmp_path, quiet=True)
+    (tmp_path / "SOUL.md").write_bytes(b"\xff\xfe not UTF-8 \x80\n")
+
+    packed = mag.pack(tmp_path, budget=100_000, pinned=["*.md"])
+    modes = {f["file"]: f["mode"] for f in packed["files"]}
+    assert modes == {"SOUL.md": "summary", "draft-cat-poem.md": "full", "draft-cat-poem-v2.md": "full"}
+    assert "### SOUL.md (summary)" in packed["text"]
+    assert packed["tokens"] <= packed["budget"]
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))